@@ -0,0 +1,187 @@
+import argparse
+import multiprocessing
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from shell_core import BatchShell, parse_args
+
+try:
+    import resource                  # Пиковая память процесса (только Unix)
+except ImportError:
+    resource = None
+
+NOT_COMPARED = {'script_lines', 'archive_bytes'}  # Описательные поля отчёта, не метрики
+NOISE_FLOOR = 0.001  # Замеры времени короче 1 мс не сравниваются с baseline: их разброс больше порога
+
+
+def generate_archive(zip_path, files, depth, fanout, binary_ratio, min_size, max_size,
+                     compression=zipfile.ZIP_STORED, seed=0): # Синтетический архив VFS заданной формы
+    rng = random.Random(seed)
+    dirs = [""]                                        # Дерево директорий: fanout поддиректорий на уровень
+    level = [""]
+    for d in range(depth):
+        level = [f"{parent}d{d}_{i}/" for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    payload = rng.randbytes(max_size)                  # Общий буфер: генерация не зависит от размера файлов
+    text = (b"lorem ipsum dolor sit amet\n" * (max_size // 27 + 1))[:max_size]
+    with zipfile.ZipFile(zip_path, 'w', compression) as zf:
+        for d in dirs[1:]:                             # Явные записи директорий: пустые тоже попадают в VFS
+            zf.writestr(f"bench/{d}", b"")
+        for i in range(files):
+            size = rng.randint(min_size, max_size)
+            if rng.random() < binary_ratio:
+                name, data = f"bin{i}.dat", b"\xff" + payload[:max(size - 1, 0)] # Заведомо не UTF-8
+            else:
+                name, data = f"file{i}.txt", text[:size]
+            zf.writestr(f"bench/{rng.choice(dirs)}{name}", data)
+    return dirs
+
+
+def best_of(repeat, fn, setup=None): # Лучшее время из repeat запусков в секундах (шум планировщика не попадает в метрику)
+    best = None
+    for _ in range(repeat):
+        args = None                                    # Прежние аргументы освобождаются до подготовки новых
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def new_shell(zip_path, sink): # Оболочка без окна с выводом в sink
+    return BatchShell(parse_args(['-vfs', zip_path]), sink)
+
+
+def loaded_shell(zip_path, sink): # Оболочка с уже загруженным архивом (загрузка не входит в замер)
+    shell = new_shell(zip_path, sink)
+    shell.load_vfs(zip_path)
+    return (shell,)
+
+
+def run_case(zip_path, dirs, ops, repeat, trace_memory): # Замеры для одного архива (выполняется в отдельном процессе)
+    results = {}
+    with open(os.devnull, 'w') as sink:
+        if trace_memory:
+            tracemalloc.start()
+        shell = new_shell(zip_path, sink)
+        shell.load_vfs(zip_path)
+        if trace_memory:
+            results['load_vfs_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        peak_rss = peak_rss_bytes()                     # Процесс свежий: пик - интерпретатор и загруженная VFS
+        if peak_rss is not None:
+            results['load_vfs_peak_rss_bytes'] = peak_rss
+        results['load_vfs'] = best_of(repeat, lambda s: s.load_vfs(zip_path), lambda: (new_shell(zip_path, sink),))
+
+        rng = random.Random(1)
+        dir_paths = ["/" + d.rstrip('/') for d in dirs]
+        file_paths = list(shell.files)
+        rng.shuffle(file_paths)
+        sample_dirs = [rng.choice(dir_paths) for _ in range(ops)]
+        sample_files = file_paths[:ops]
+        del file_paths
+
+        results['normalize_path'] = best_of(repeat, lambda: [shell.normalize_path(p + "/../x/./y") for p in sample_dirs])
+        results['list_dir'] = best_of(repeat, lambda: [shell.list_dir(p) for p in sample_dirs])
+        results['command_du'] = best_of(repeat, lambda: [shell.command_du([p]) for p in sample_dirs])
+        results['command_du_s_root'] = best_of(repeat, lambda: [shell.command_du(['-s', '/']) for _ in range(ops)])
+        results['command_du_a_root'] = best_of(repeat, lambda: shell.command_du(['-a', '/']))
+        results['command_chmod'] = best_of(repeat, lambda: [shell.command_chmod(['755', p]) for p in sample_files])
+
+        script = []                                     # Повтор сценария без окна
+        for p in sample_dirs:
+            script += [f"cd {p}", "ls", "du", "cd /"]
+        results['script_replay'] = best_of(repeat, lambda: shell.run_lines(script))
+        results['script_lines'] = len(script)
+        shell = None                                    # rm удаляет файлы: каждый повтор - на заново загруженной VFS
+        results['command_rm'] = best_of(repeat, lambda s: [s.command_rm([p]) for p in sample_files],
+                                        lambda: loaded_shell(zip_path, sink))
+    return results
+
+
+def peak_rss_bytes(): # Пиковая память процесса на текущий момент
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024   # В Linux ru_maxrss в КБ
+
+
+def compare(report, baseline, threshold): # Поиск регрессий относительно сохранённого отчёта
+    regressions = []
+    old_cases = {case['name']: case for case in baseline.get('cases', [])}
+    for case in report['cases']:
+        old = old_cases.get(case['name'])
+        if old is None:
+            continue
+        for key, value in case['results'].items():
+            old_value = old['results'].get(key)
+            if key in NOT_COMPARED or not old_value:
+                continue
+            if not key.endswith('_bytes') and max(value, old_value) < NOISE_FLOOR:
+                continue
+            ratio = value / old_value
+            if ratio > 1 + threshold:
+                regressions.append({'case': case['name'], 'metric': key,
+                                    'baseline': old_value, 'current': value, 'ratio': round(ratio, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк эмулятора на синтетических VFS-архивах")
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="число файлов в архиве (несколько значений - несколько прогонов)")
+    parser.add_argument('--depth', type=int, default=3, help="глубина дерева директорий")
+    parser.add_argument('--fanout', type=int, default=8, help="число поддиректорий на уровне")
+    parser.add_argument('--binary-ratio', type=float, default=0.2, help="доля бинарных файлов")
+    parser.add_argument('--min-size', type=int, default=0, help="минимальный размер файла, байт")
+    parser.add_argument('--max-size', type=int, default=1024, help="максимальный размер файла, байт")
+    parser.add_argument('--deflate', action='store_true', help="сжимать архив (по умолчанию без сжатия)")
+    parser.add_argument('--ops', type=int, default=1000, help="число вызовов для каждой замеряемой операции")
+    parser.add_argument('--repeat', type=int, default=5, help="число повторов каждого замера (в отчёт идёт лучшее время)")
+    parser.add_argument('--tracemalloc', action='store_true', help="пиковая память load_vfs через tracemalloc (замедляет замер load_vfs)")
+    parser.add_argument('--workdir', help="каталог для сгенерированных архивов (по умолчанию временный)")
+    parser.add_argument('--output', help="файл для JSON-отчёта (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="JSON-отчёт для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление относительно baseline")
+    args = parser.parse_args(argv)
+
+    compression = zipfile.ZIP_DEFLATED if args.deflate else zipfile.ZIP_STORED
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'cases': []}
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for files in args.files:
+            name = f"files={files},depth={args.depth},fanout={args.fanout}"
+            zip_path = os.path.join(workdir, f"bench_{files}.zip")
+            dirs = generate_archive(zip_path, files, args.depth, args.fanout, args.binary_ratio,
+                                    args.min_size, args.max_size, compression)
+            # Каждый прогон - в новом процессе: пиковая память не включает генерацию архивов и прежние прогоны
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = pool.submit(run_case, zip_path, dirs, min(args.ops, files), args.repeat,
+                                      args.tracemalloc).result()
+            results['archive_bytes'] = os.path.getsize(zip_path)
+            report['cases'].append({'name': name, 'results': results})
+            os.remove(zip_path)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.threshold)
+        status = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
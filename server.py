@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import socket
+import stat
+import sys
+from shell_core import ShellCore
+from vfs_store import OverlayStore
+
+
+class SessionShell(ShellCore):  # Сессия сервера: своя текущая директория, история и copy-on-write копия VFS
+    def __init__(self, options, base_store):
+        super().__init__(dict(options, vfs=[], snapshot=None, persist=False, profile=None))
+        self.vfs_path = ", ".join(options['vfs']) or None
+        self.store = OverlayStore(base_store)   # rm и chmod не затрагивают общее дерево
+        self.buffer = []                        # Вывод текущего запроса
+
+    def write_output(self, text):
+        self.buffer.append(text)
+
+    def run_request(self, line): # Выполнение одной строки, возвращает ответ клиенту
+        line = line.strip()
+        errors = self.error_count
+        if line and not line.startswith('#'):
+            self.history.append(line)
+            self.history_index = len(self.history)
+            self.execute_command(line)
+        return self.take_response(self.error_count - errors)
+
+    def take_response(self, errors=0):
+        response = {'output': "\n".join(self.buffer), 'errors': errors, 'exit': self.exit_requested}
+        self.buffer = []
+        return response
+
+
+class LoaderShell(ShellCore):  # Однократная загрузка общей VFS, сообщения идут в лог сервера
+    def write_output(self, text):
+        print(text, file=sys.stderr)
+
+
+class ShellServer:  # Сервер сессий на Unix-сокете с одной загруженной VFS
+    def __init__(self, options):
+        self.options = options
+        loader = LoaderShell(options)
+        loader.load_mounts()
+        self.base_store = loader.store
+
+    async def handle_client(self, reader, writer):
+        session = SessionShell(self.options, self.base_store)
+        loop = asyncio.get_running_loop()
+        try:
+            session.display_welcome()
+            await self.send(writer, session.take_response())
+            while not session.exit_requested:
+                line = await reader.readline()
+                if not line:                    # Клиент отключился
+                    break
+                # Команда выполняется в пуле потоков: длинная команда одной сессии не задерживает остальные
+                response = await loop.run_in_executor(None, session.run_request, line.decode('utf-8'))
+                await self.send(writer, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def send(writer, response): # Один ответ - одна строка JSON
+        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+        await writer.drain()
+
+    async def serve(self, socket_path):
+        server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+        print(f"Serving VFS {', '.join(self.options['vfs']) or 'default'} on {socket_path}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def remove_socket(socket_path): # Удаление сокета от предыдущего запуска; False, если по пути лежит не сокет
+    try:
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            return False
+        os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def run_server(options): # Запуск сервера до прерывания (Ctrl+C)
+    socket_path = options['serve']
+    if not remove_socket(socket_path):          # Обычный файл по ошибке в -serve не удаляется
+        print(f"Error: {socket_path} exists and is not a socket", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(ShellServer(options).serve(socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remove_socket(socket_path)
+    return 0
+
+
+def run_client(options): # Терминальный клиент: команды из stdin, вывод сервера в stdout
+    interactive = sys.stdin.isatty()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(options['connect'])
+        except OSError as e:
+            print(f"Error: cannot connect to {options['connect']}: {e}", file=sys.stderr)
+            return 1
+        stream = sock.makefile('rwb')
+        errors = 0
+
+        def receive():
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            response = json.loads(line)
+            if response['output']:
+                print(response['output'])
+            return response
+
+        try:
+            receive()                           # Приветствие сервера
+            while True:
+                try:
+                    command = input("> ") if interactive else sys.stdin.readline()
+                except EOFError:
+                    break
+                if not interactive and not command:
+                    break
+                stream.write(command.strip().encode('utf-8') + b"\n")
+                stream.flush()
+                response = receive()
+                errors += response['errors']
+                if response['exit']:
+                    break
+        except KeyboardInterrupt:
+            pass
+        except ConnectionError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 1 if errors else 0
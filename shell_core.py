@@ -0,0 +1,814 @@
+import os
+import re
+import shlex
+import sys
+import zipfile
+import heapq
+import threading
+import time
+import json
+import cProfile
+import fnmatch
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from collections import deque
+import snapshot
+from vfs_store import DIR_BLOCK, VFSStore, ZipSource, FilesView, DirsView, PermissionsView
+
+
+OUTPUT_CHUNK = 1000  # Число строк, после которого длинный вывод передаётся на экран
+STATS_SAMPLES = 10000  # Сколько последних замеров хранится для каждой команды и фазы
+PHASES = ('parse', 'execute', 'render')  # Фазы выполнения команды для time и stats
+GLOB_MAGIC = re.compile(r'[*?[]')  # Символы шаблонов путей в ls, rm и chmod
+
+
+class CommandCancelled(Exception):  # Выполнение команды прервано пользователем (Ctrl+C)
+    pass
+
+
+def plural(count, one, many): # '1 file', '2 files'
+    return f"{count} {one if count == 1 else many}"
+
+
+def parse_mount(spec): # 'archive.zip[:/mount/point]' -> (архив, точка монтирования)
+    zip_path, sep, mountpoint = spec.rpartition(':')
+    if sep and len(zip_path) > 1 and mountpoint.startswith('/'): # 'C:/x.zip' - диск Windows, а не точка монтирования
+        return zip_path, mountpoint
+    return spec, "/"
+
+
+def scan_archive(zip_path): # Чтение центрального каталога архива: (общий префикс, [(путь, размер или -1 для директорий)])
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:                                   # Раскрываем зип в режиме чтения
+        infos = zip_ref.infolist()
+    common_prefix = os.path.commonprefix([info.filename for info in infos])           # Находим общий префикс
+    common_prefix = common_prefix[:common_prefix.rfind('/') + 1]                       # Обрезаем до последней / (или до пустой строки)
+    entries = []
+    for info in infos:
+        file_path = info.filename[len(common_prefix):]                                 # Удаляем общий префикс из пути
+        if file_path:                                                                  # Пустой путь - сама общая директория
+            entries.append((file_path, -1 if info.is_dir() else info.file_size))
+    return common_prefix, entries
+
+
+def parse_args(args): # Разбор аргументов командной строки
+    options = {'vfs': [], 'script': None, 'batch': False, 'output': None, 'scrollback': 10000,
+               'snapshot': None, 'persist': False, 'profile': None, 'serve': None, 'connect': None}
+    i = 0
+    while i < len(args):
+        if args[i] == '-vfs' and i + 1 < len(args):       # Проверка на путь к физ расположению VFS
+            options['vfs'].append(args[i + 1])            # Сохранение пути к VFS (архив[:точка монтирования])
+            i += 1
+        elif args[i] == '-script' and i + 1 < len(args):  # Проверка на путь к стартовому скрипту
+            options['script'] = args[i + 1]               # Сохранение пути к начальному скрипту
+            i += 1
+        elif args[i] == '-batch':                         # Пакетный режим без графического интерфейса
+            options['batch'] = True
+        elif args[i] == '-output' and i + 1 < len(args):  # Файл для вывода в пакетном режиме
+            options['output'] = args[i + 1]
+            i += 1
+        elif args[i] == '-snapshot' and i + 1 < len(args): # Файл снимка индекса VFS для быстрого старта
+            options['snapshot'] = args[i + 1]
+            i += 1
+        elif args[i] == '-persist':                       # Сохранять изменения rm/chmod в журнал снимка
+            options['persist'] = True
+        elif args[i] == '-profile' and i + 1 < len(args): # Файл профиля сессии (.json - trace events, иначе cProfile)
+            options['profile'] = args[i + 1]
+            i += 1
+        elif args[i] == '-serve' and i + 1 < len(args):   # Режим сервера сессий на Unix-сокете
+            options['serve'] = args[i + 1]
+            i += 1
+        elif args[i] == '-connect' and i + 1 < len(args): # Терминальный клиент сервера сессий
+            options['connect'] = args[i + 1]
+            i += 1
+        elif args[i] == '-scrollback' and i + 1 < len(args) and args[i + 1].isdigit(): # Лимит строк в окне вывода (0 - без лимита)
+            options['scrollback'] = int(args[i + 1])
+            i += 1
+        i += 1
+    return options
+
+
+class ShellCore:  # Логика эмулятора без графического интерфейса: VFS, разбор и выполнение команд
+    def __init__(self, options):
+        self.history = []                   # Инициализация списка истории команд
+        self.history_index = -1             # Индекс для навигации по истории
+        self.current_dir = "/"              # Свойство для хранения текущей рабочей директории
+        self.mounts = [(zip_path, self.normalize_path(mountpoint, "/")) # Архивы VFS и нормализованные точки монтирования
+                       for zip_path, mountpoint in map(parse_mount, options['vfs'])]
+        self.vfs_path = ", ".join(options['vfs']) or None # Пути к физическому расположению VFS (для вывода)
+        self.startup_script = options['script'] # Путь к стартовому скрипту
+        self.error_count = 0                # Количество команд, завершившихся ошибкой
+        self.exit_requested = False         # Была ли выполнена команда exit
+        self.snapshot_path = options['snapshot'] # Файл снимка индекса VFS
+        self.persist = options['persist']   # Записывать ли изменения в журнал снимка
+        self.journal = None                 # Журнал изменений снимка (при -persist)
+        self.cancel_event = threading.Event() # Запрос на прерывание текущей команды
+        self.render_time = 0.0              # Время вывода в рамках текущей команды
+        self.command_stats = {}             # Имя команды -> {'count': N, фаза: последние замеры}
+        self.profile_path = options['profile'] # Файл профиля сессии
+        self.profiler = None                # cProfile (если профиль не в формате trace events)
+        self.trace_events = None            # События команд для chrome://tracing / Perfetto
+        if self.profile_path:
+            if self.profile_path.endswith('.json'):
+                self.trace_events = []
+            else:
+                self.profiler = cProfile.Profile()
+
+        self.store = VFSStore()             # Дерево директорий и колонки атрибутов файлов
+
+    @property
+    def files(self): # Файлы: путь -> содержимое (читается из архива по требованию)
+        return FilesView(self.store)
+
+    @property
+    def dirs(self): # Множество путей директорий
+        return DirsView(self.store)
+
+    @property
+    def file_permissions(self): # ЭТАП 5: Права доступа для файлов
+        return PermissionsView(self.store)
+
+    def start_session(self): # Загрузка VFS и приветствие (в окне Tk выполняется в фоновом потоке)
+        if self.mounts:
+            self.load_mounts()            # Загрузка из ZIP архивов
+            if self.snapshot_path and self.persist and len(self.mounts) == 1 and self.store.file_count: # Изменения сессии пишутся в журнал
+                self.journal = snapshot.Journal(self.snapshot_path)
+
+        self.display_welcome()
+
+    def check_cancelled(self): # Вызывается в длинных циклах: прерывает команду по Ctrl+C
+        if self.cancel_event.is_set():
+            raise CommandCancelled()
+
+    def _split_and_expand(self, command_line: str):        # Парсинг и раскрытие переменных
+        try:
+            tokens = shlex.split(command_line, posix=True) # Разделение строки на части по " ", /
+        except ValueError as e: # Есть ошибка
+            self.display_error(f"parse error: {e}")
+            return []
+
+        def expand_env_all(s: str) -> str:                 # Функция раскрытия переменных
+            s1 = os.path.expanduser(s)                     # Заменяет символ ~ на полный путь к домашней директории
+
+            def repl(m):                                   # 2. Раскрытие $VAR и ${VAR}
+                name = m.group(1) or m.group(2)
+                if os.name == 'nt':
+                    if name.upper() == 'HOME' and name not in os.environ:
+                        return os.environ.get('USERPROFILE', m.group(0))
+                return os.environ.get(name, m.group(0))   # Ищет переменную в окружении, если не находит - возвращает исходный текст
+
+            s2 = re.sub(r"\$(\w+)|\$\{([^}]+)\}", repl, s1) # Регулярное выражение
+            s3 = os.path.expandvars(s2)                   # Дополнительное раскрытие (резервный механизм)
+            return s3
+        return [expand_env_all(t) for t in tokens] # Возвращает список полностью обработанных токенов
+
+    def display_welcome(self):
+        self.display_lines([
+            "Shell Emulator - Variant 26",
+            f"VFS: {self.vfs_path or 'default'}",
+            "Commands: ls, cd, history, du, rm, chmod, meminfo, time, stats, exit",
+            "-" * 50,
+        ])
+
+    def write_output(self, text): # Вывод строки - реализуется интерфейсом (окно Tk или поток)
+        raise NotImplementedError
+
+    def display_output(self, text): # Вывод с учётом времени в фазе render
+        start = time.perf_counter()
+        self.write_output(text)
+        self.render_time += time.perf_counter() - start
+
+    def display_lines(self, lines): # Вывод блока строк одним вызовом
+        if lines:
+            self.display_output("\n".join(lines))
+
+    def display_error(self, text): # Вывод сообщения об ошибке с подсчётом ошибок
+        self.error_count += 1
+        self.display_output(text)
+
+    def request_exit(self): # Обработка команды exit
+        self.exit_requested = True
+
+    def execute_command(self, command_line):
+        start = time.perf_counter()
+        parts = self._split_and_expand(command_line)  # Используем метод с раскрытием переменных
+        parse_time = time.perf_counter() - start
+        if not parts:
+            return
+        command = parts[0]                            # Первое слово - имя команды
+        args = parts[1:]                              # Срез со второго - аргументы
+
+        raw = command_line.strip()                    # Специальная обработка для случаев, когда введена только переменная
+        if len(parts) == 1:
+            if raw.startswith('~') or raw.startswith('$'):
+                self.display_output(parts[0])
+                return
+
+        if command == "time":                         # time <команда>: замер фаз одной команды
+            if not args:
+                self.display_error("usage: time command [args...]")
+                return
+            timings = self._run_timed(args[0], args[1:], start, parse_time)
+            self.display_output("real {:.6f}s  parse {:.6f}s  execute {:.6f}s  render {:.6f}s".format(
+                sum(timings), *timings))
+        else:
+            self._run_timed(command, args, start, parse_time)
+
+    def _run_timed(self, command, args, start, parse_time): # Выполнение с замером фаз execute и render
+        self.render_time = 0.0
+        exec_start = time.perf_counter()
+        known = False
+        try:
+            known = self.dispatch_command(command, args)
+        finally:
+            end = time.perf_counter()
+            render_time = self.render_time
+            timings = (parse_time, end - exec_start - render_time, render_time)
+            self._record_stats(command if known else "(unknown)", timings, start, end)
+        return timings
+
+    def dispatch_command(self, command, args): # Обработчик команд, возвращает False для неизвестной команды
+        if command == "ls":
+            self.command_ls(args)
+        elif command == "cd":
+            self.command_cd(args)
+        elif command == "history":
+            self.command_history(args)
+        elif command == "du":
+            self.command_du(args)
+        elif command == "rm":
+            self.command_rm(args)
+        elif command == "chmod":
+            self.command_chmod(args)
+        elif command == "meminfo":
+            self.command_meminfo(args)
+        elif command == "stats":
+            self.command_stats_report(args)
+        elif command == "exit":
+            self.request_exit()
+        else:
+            self.display_error(f"Command not found: {command}")
+            return False
+        return True
+
+    def _record_stats(self, command, timings, start, end): # Накопление замеров для stats и профиля
+        entry = self.command_stats.get(command)
+        if entry is None:
+            entry = {'count': 0}
+            for phase in PHASES:
+                entry[phase] = deque(maxlen=STATS_SAMPLES)
+            self.command_stats[command] = entry
+        entry['count'] += 1
+        for phase, value in zip(PHASES, timings):
+            entry[phase].append(value)
+        if self.trace_events is not None:              # Событие длительности в формате trace event (мкс)
+            self.trace_events.append({
+                'name': command, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                'args': {phase: value * 1e6 for phase, value in zip(PHASES, timings)},
+            })
+
+    def record_render(self, start, end): # Время отрисовки, выполненной вне команды (окно Tk)
+        self._record_stats("(widget flush)", (0.0, 0.0, end - start), start, end)
+
+    # ЭТАП 2: Выполнение скрипта
+    def run_script(self, script_path):
+        try:
+            with open(script_path, 'r') as f:              # Открываем скрипт на чтение
+                self.run_lines(f)
+        except CommandCancelled:                           # Прерывание останавливает весь скрипт
+            raise
+        except Exception as e:                             # Если встречается исключение (ошибка)
+            self.display_error(f"Script error: {e}")
+
+    def run_lines(self, lines): # Выполнение команд построчно (файл скрипта или stdin)
+        for line in lines:
+            line = line.strip()                            # Удаляем символы в начале и конце строки
+            if line and not line.startswith('#'):          # Если строка есть и это не комментарий
+                self.display_output(f"> {line}")           # Выводим
+                self.history.append(line)
+                self.history_index = len(self.history)
+                self.execute_command(line)                 # Команда выполняется
+                if self.exit_requested:                    # После exit оставшиеся строки не выполняются
+                    break
+
+    def load_mounts(self): # Загрузка всех архивов из -vfs (несколько архивов - параллельно)
+        if len(self.mounts) == 1:
+            self.load_vfs(*self.mounts[0])
+        elif self.mounts:
+            self.load_archives(self.mounts)
+
+    def load_vfs(self, zip_path, mountpoint="/"): # Загружаем VFS из ZIP-архива (читается только центральный каталог)
+        if self.snapshot_path and self._load_snapshot(zip_path, mountpoint):          # Снимок актуален - архив не разбирается
+            self.display_output(f"VFS loaded from {zip_path} (snapshot)")
+            return
+        try:
+            prefix, entries = scan_archive(zip_path)                                   # Содержимое файлов будет читаться из архива лениво
+        except FileNotFoundError:
+            self.display_error(f"Error: VFS file not found: {zip_path}")
+            return
+        except zipfile.BadZipFile:
+            self.display_error(f"Error: Invalid ZIP format: {zip_path}")
+            return
+        if not entries:
+            self.display_output("Empty VFS archive")                                   # Пустой архив
+            return
+
+        try:
+            self._index_members(zip_path, mountpoint, prefix, entries)
+        except CommandCancelled:                                                       # Частично загруженный индекс не используется
+            self.store = VFSStore()
+            raise
+        self.store.compute_sizes()                                                     # Один проход для размеров всех поддеревьев
+        if self.snapshot_path:
+            self._save_snapshot(zip_path, mountpoint)
+        self.display_output(f"VFS loaded from {zip_path}")
+
+    def load_archives(self, mounts): # Параллельный разбор нескольких архивов и монтирование в одно дерево
+        if self.snapshot_path:
+            self.display_output("Warning: -snapshot is ignored when several archives are mounted")
+        workers = min(len(mounts), os.cpu_count() or 1)
+        if workers == 1:                                                               # Один процессор: пул лишь добавил бы запуск процессов и передачу списков
+            try:
+                for zip_path, mountpoint in mounts:
+                    self.check_cancelled()
+                    self._merge_archive(zip_path, mountpoint, lambda: scan_archive(zip_path))
+            except CommandCancelled:
+                self.store = VFSStore()
+                raise
+            self.store.compute_sizes()
+            return
+        pool = ProcessPoolExecutor(max_workers=workers,                                # Разбор каталогов - в отдельных процессах
+                                   mp_context=multiprocessing.get_context('spawn'))    # Без fork процесса с потоками и Tk
+        cancelled = False
+        futures = [pool.submit(scan_archive, zip_path) for zip_path, _ in mounts]
+        try:
+            pending = set(futures)
+            while pending:                                                             # Ожидание с проверкой Ctrl+C
+                self.check_cancelled()
+                _, pending = wait(pending, timeout=0.1)
+            for (zip_path, mountpoint), future in zip(mounts, futures):                # Слияние - в порядке аргументов
+                self._merge_archive(zip_path, mountpoint, future.result)
+        except CommandCancelled:
+            cancelled = True
+            self.store = VFSStore()
+            raise
+        finally:                                                                       # Пул закрывается при любой ошибке
+            pool.shutdown(wait=not cancelled, cancel_futures=cancelled)
+        self.store.compute_sizes()
+
+    def _merge_archive(self, zip_path, mountpoint, scan): # Слияние разобранного архива с деревом (scan возвращает результат scan_archive)
+        try:
+            prefix, entries = scan()
+        except FileNotFoundError:
+            self.display_error(f"Error: VFS file not found: {zip_path}")
+            return
+        except zipfile.BadZipFile:
+            self.display_error(f"Error: Invalid ZIP format: {zip_path}")
+            return
+        self._index_members(zip_path, mountpoint, prefix, entries)                     # Слияние выполняется последовательно
+        self.display_output(f"VFS loaded from {zip_path} at {mountpoint}")
+
+    def _index_members(self, zip_path, mountpoint, prefix, entries): # Добавление элементов архива в дерево
+        store = self.store
+        source_id = store.add_source(ZipSource(zip_path, prefix, mountpoint=mountpoint)) # Источник содержимого файлов
+        base = mountpoint.rstrip('/')                                                  # Точка монтирования без завершающей /
+        store.add_dir(base)
+        for index, (file_path, size) in enumerate(entries):                            # Проходим по всем элементам архива
+            if not index & 0xFFF:
+                self.check_cancelled()
+            if size < 0:                                                               # Если элемент - директория
+                store.add_dir(base + "/" + file_path)                                  # Добавляем директорию (и родителей) в дерево
+            else:                                                                      # Файл: размер и права - в колонки, имя - в дерево
+                store.add_file(base + "/" + file_path, size, source_id)               # Родительские директории создаются автоматически
+
+    def _save_snapshot(self, zip_path, mountpoint): # Сохранение индекса VFS в снимок
+        payload = {'store': self.store, 'mountpoint': mountpoint}
+        try:
+            snapshot.write_snapshot(self.snapshot_path, zip_path, payload)
+            snapshot.reset_journal(self.snapshot_path)  # Старый журнал относится к прежнему архиву
+        except (OSError, RecursionError) as e:
+            self.display_output(f"Warning: cannot write snapshot {self.snapshot_path}: {e}")
+
+    def _load_snapshot(self, zip_path, mountpoint): # Загрузка индекса из снимка и применение журнала изменений
+        payload = snapshot.read_snapshot(self.snapshot_path, zip_path)
+        if (not isinstance(payload, dict) or not isinstance(payload.get('store'), VFSStore)
+                or payload.get('mountpoint') != mountpoint):  # Снимок другого формата или другой точки монтирования
+            return False
+        self.store = payload['store']
+        for source in self.store.sources:              # Архив мог быть указан другим путём
+            source.zip_path = zip_path
+        for record in snapshot.read_journal(self.snapshot_path):
+            if record[0] == 'rm' and len(record) == 2:
+                self.store.remove_paths([record[1]])   # Файл или директория (rm -r)
+            elif record[0] == 'chmod' and len(record) == 3:
+                node = self.store.find_dir(record[2])
+                if node is None:
+                    self.store.set_mode(record[2], int(record[1], 8))
+                else:                                  # chmod -R: все файлы поддерева
+                    self.store.set_modes([file_id for _, file_id in self.store.iter_files(record[2], node)],
+                                         int(record[1], 8))
+        return True
+
+    def _join_path(self, dir_path, name): # Полный путь к элементу директории
+        return f"/{name}" if dir_path == "/" else f"{dir_path}/{name}"
+
+    # === ЭТАП 4: Основные команды ===
+    def normalize_path(self, path, current_dir=None): # Нормализация путей
+        if current_dir is None:                       # Если не указана текущая директория
+            current_dir = self.current_dir            # Используем текущую рабочую директорию эмулятора
+        if path.startswith("/"):                      # Если это абсолютный путь (начинается с /)
+            normalized = path
+        else:                                         # Относительный путь
+            if current_dir == "/":                    # Если текущая директория корень
+                normalized = "/" + path               # Добавляем путь к корню
+            else:
+                normalized = current_dir + "/" + path # Объединяем текущую директорию и путь
+        parts = []                                    # Список для хранения частей пути
+        for part in normalized.split('/'):
+            if part == "..":
+                if parts:
+                    parts.pop()                       # Удаляем последнюю добавленную часть пути
+            elif part and part != ".":
+                parts.append(part)                    # Добавляем корректную часть пути в список
+
+        result = "/" + "/".join(parts) if parts else "/"
+        return result
+
+    def list_dir(self, path):
+        normalized_path = self.normalize_path(path)             # Нормализуем путь
+        node = self.store.find_dir(normalized_path)                  # Находим узел директории в дереве
+        if node is None:
+            raise FileNotFoundError(normalized_path)
+        return sorted(node.dirs), sorted(node.files)
+
+    def expand_pattern(self, pattern): # Раскрытие пути или шаблона (*, ?, [...], **) по дереву: (файлы, директории)
+        normalized_path = self.normalize_path(pattern)
+        store = self.store
+        if store.find_file(normalized_path) is not None:      # Существующий путь берётся как есть, даже с [, * или ?
+            return [normalized_path], []
+        if store.find_dir(normalized_path) is not None:
+            return [], [normalized_path]
+        if not GLOB_MAGIC.search(normalized_path):
+            return [], []
+        parts = [part for part in normalized_path.split('/') if part]
+        level = {"/": store.root}                              # Директории, совпавшие с уже пройденными частями шаблона
+        files = set()
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1                         # Файлы совпадают только с последней частью
+            matched = {}
+            if part == "**":                                   # Ноль или больше уровней директорий
+                for path, node in level.items():
+                    for sub_path, sub in store.iter_dirs(path, node):
+                        self.check_cancelled()
+                        if not (last and sub is node):        # Последний ** не включает саму начальную директорию
+                            matched[sub_path] = sub
+                        if last:
+                            files.update(self._join_path(sub_path, name) for name in sub.files)
+            elif not GLOB_MAGIC.search(part):                  # Часть без шаблона - прямой переход по имени
+                for path, node in level.items():
+                    if part in node.dirs:
+                        matched[self._join_path(path, part)] = node.dirs[part]
+                    if last and part in node.files:
+                        files.add(self._join_path(path, part))
+            else:                                              # Шаблон сравнивается только с именами в этой директории
+                match = re.compile(fnmatch.translate(part)).match
+                for path, node in level.items():
+                    self.check_cancelled()
+                    for name, child in node.dirs.items():
+                        if match(name):
+                            matched[self._join_path(path, name)] = child
+                    if last:
+                        files.update(self._join_path(path, name) for name in node.files if match(name))
+            level = matched
+        return sorted(files), sorted(level)
+
+    def _parse_flags(self, command, args, allowed): # Разбор флагов вида -rf: (множество флагов, остальные аргументы) или None
+        flags = set()
+        while args and args[0].startswith('-') and args[0] != '-':
+            for flag in args[0][1:]:
+                if flag not in allowed:
+                    self.display_error(f"{command}: invalid option -- '{flag}'")
+                    return None
+                flags.add(flag)
+            args = args[1:]
+        return flags, args
+
+    def command_ls(self, args):
+        parsed = self._parse_flags("ls", args, "R")
+        if parsed is None:
+            return
+        flags, targets = parsed
+        files = []
+        dirs = []
+        for target in targets or ["."]:                        # Определяем пути для отображения
+            found_files, found_dirs = self.expand_pattern(target)
+            if not found_files and not found_dirs:
+                self.display_error(f"ls: {target}: No such directory")
+            files += found_files
+            dirs += found_dirs
+        lines = [f"{self.store.mode_str(self.store.find_file(path))} {path}" for path in files] # Совпавшие файлы
+        for path in dirs:
+            node = self.store.find_dir(path)
+            if 'R' in flags:                                   # ls -R: всё поддерево
+                self._ls_walk(path, node, lines)
+            else:
+                lines.extend(self._ls_block(path, node))
+        if lines:
+            self.display_lines(lines)
+
+    def _ls_block(self, path, node): # Содержимое одной директории
+        lines = [f"Directory: {path}"]                         # Вывод собирается в один блок
+        lines.extend(f"  {d}/" for d in sorted(node.dirs))
+        for f in sorted(node.files):
+            lines.append(f"{self.store.mode_str(node.files[f])} {f}") # Права доступа берутся из колонки по номеру файла
+        if not node.dirs and not node.files:
+            lines.append("  (empty)")
+        return lines
+
+    def _ls_walk(self, path, node, lines): # Вывод директорий поддерева в порядке обхода в глубину
+        stack = [(path, node)]                                 # Явный стек: глубина дерева не ограничена глубиной рекурсии
+        while stack:
+            self.check_cancelled()
+            path, node = stack.pop()
+            lines.extend(self._ls_block(path, node))
+            if len(lines) >= OUTPUT_CHUNK:                     # Длинный вывод отдаётся частями по мере получения
+                self.display_lines(lines)
+                lines.clear()
+            for name in sorted(node.dirs, reverse=True):       # Первая по порядку поддиректория снимается со стека первой
+                stack.append((self._join_path(path, name), node.dirs[name]))
+
+    def command_cd(self, args):
+        if not args:
+            self.current_dir = "/"
+        else:
+            path = args[0]                                             # Извлекает первый аргумент как путь
+            normalized_path = self.normalize_path(path)                # Нормализует путь
+            if self.store.find_dir(normalized_path) is not None:            # Если директория есть в дереве
+                self.current_dir = normalized_path                     # Объявляем текущую директорию
+            else:
+                self.display_error(f"cd: {path}: No such directory")
+                return
+        self.display_output(f"Current directory: {self.current_dir}")
+
+    def command_history(self, args):
+        if not self.history:                          # Если история пустая
+            self.display_output("history: no history available")
+        else:
+            self.display_lines([f"{i:4}  {cmd}" for i, cmd in enumerate(self.history, 1)]) # Индекс и команда
+
+    def command_du(self, args):
+        paths = []                                    # Пути для анализа (все аргументы-операнды)
+        summarize = False                             # -s: только итоговый размер
+        show_files = False                            # -a: вывод файлов вместе с директориями
+        max_depth = None                              # --max-depth=N / -d N: рекурсивный вывод до глубины N
+        top = None                                    # --sort[=N]: N самых больших поддеревьев
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == '-s':
+                summarize = True
+            elif arg == '-a':
+                show_files = True
+            elif arg == '-d' and i + 1 < len(args) and args[i + 1].isdigit():
+                max_depth = int(args[i + 1])
+                i += 1
+            elif arg.startswith('--max-depth=') and arg[len('--max-depth='):].isdigit():
+                max_depth = int(arg[len('--max-depth='):])
+            elif arg == '--sort':
+                top = 10
+            elif arg.startswith('--sort=') and arg[len('--sort='):].isdigit():
+                top = int(arg[len('--sort='):])
+            elif arg.startswith('-') and arg != '-':
+                self.display_error(f"du: invalid option -- '{arg}'")
+                return
+            else:
+                paths.append(arg)
+            i += 1
+        for path in paths or [self.current_dir]:      # Определяем пути
+            self._du_path(path, summarize, show_files, max_depth, top, len(paths) > 1)
+
+    def _du_path(self, path, summarize, show_files, max_depth, top, titled): # du для одного пути
+        normalized_path = self.normalize_path(path)   # Нормализуем путь
+        node = self.store.find_dir(normalized_path)        # Находим узел директории в дереве
+        if node is None:
+            self.display_error(f"du: cannot access '{path}': No such directory")
+            return
+        if titled and not summarize and top is None:  # Несколько путей: блок с относительными путями подписывается
+            self.display_output(f"{normalized_path}:")
+
+        if summarize:                                 # Размер поддерева уже посчитан - O(1)
+            self.display_output(f"{node.size:8}  {normalized_path}")
+        elif top is not None:
+            self.display_lines(self._du_largest(node, normalized_path, top))
+        elif show_files or max_depth is not None:
+            lines = []
+            self._du_walk(node, max_depth, show_files, lines)
+            self.display_lines(lines)
+        else:
+            self.display_lines(self._du_children(node))
+
+    def _du_children(self, node): # Размеры непосредственного содержимого директории
+        lines = []                                    # Вывод собирается в один блок
+        sizes = self.store.sizes
+        for name in sorted(node.files):               # Проходим только по файлам этой директории
+            lines.append(f"{sizes[node.files[name]]:8}  {name}")  # Размер из метаданных, без чтения содержимого
+        for name in sorted(node.dirs):                # Проходим только по поддиректориям
+            lines.append(f"{node.dirs[name].size + DIR_BLOCK:8}  {name}/")  # Размер поддерева уже посчитан
+        if lines:
+            lines.append(f"{node.size:8}  .")
+        else:
+            lines.append(f"{node.size:8}  .  (empty)")
+        return lines
+
+    def _du_walk(self, node, max_depth, show_files, lines): # Вывод как в du -a / --max-depth (директория - после своего содержимого)
+        stack = [(node, ".", 0, False)]               # Явный стек: глубина дерева не ограничена глубиной рекурсии
+        while stack:
+            node, rel_path, depth, expanded = stack.pop()
+            if not expanded:                          # Первое посещение: сначала поддиректории, затем сама директория
+                self.check_cancelled()
+                stack.append((node, rel_path, depth, True))
+                if max_depth is None or depth < max_depth:
+                    for name in sorted(node.dirs, reverse=True): # Первая по порядку поддиректория снимается со стека первой
+                        child_path = name if rel_path == "." else f"{rel_path}/{name}"
+                        stack.append((node.dirs[name], child_path, depth + 1, False))
+                continue
+            if show_files and (max_depth is None or depth < max_depth):
+                for name in sorted(node.files):
+                    file_path = name if rel_path == "." else f"{rel_path}/{name}"
+                    lines.append(f"{self.store.sizes[node.files[name]]:8}  {file_path}")
+            size = node.size if rel_path == "." else node.size + DIR_BLOCK
+            lines.append(f"{size:8}  {rel_path}")
+            if len(lines) >= OUTPUT_CHUNK:            # Длинный вывод отдаётся частями по мере получения
+                self.display_lines(lines)
+                lines.clear()
+
+    def _du_largest(self, node, normalized_path, top): # N самых больших поддеревьев (по кэшированным размерам)
+        def subtrees():
+            stack = [(child, self._join_path(normalized_path, name)) for name, child in node.dirs.items()]
+            while stack:
+                self.check_cancelled()
+                child, child_path = stack.pop()
+                yield child.size + DIR_BLOCK, child_path
+                stack.extend((sub, f"{child_path}/{name}") for name, sub in child.dirs.items())
+        largest = heapq.nlargest(top, subtrees())
+        lines = [f"{size:8}  {child_path}/" for size, child_path in largest]
+        lines.append(f"{node.size:8}  {normalized_path}  (total)")
+        return lines
+
+    def command_rm(self, args):
+        parsed = self._parse_flags("rm", args, "rRf")
+        if parsed is None:
+            return
+        flags, targets = parsed
+        recursive = 'r' in flags or 'R' in flags      # -r: директории удаляются вместе с содержимым
+        if not targets:
+            self.display_error("rm: missing operand")
+            return
+        paths = []
+        for filename in targets:
+            if recursive and self.normalize_path(filename) == "/":
+                self.display_error(f"rm: it is dangerous to operate recursively on '{filename}'") # Корень VFS не удаляется
+                continue
+            files, dirs = self.expand_pattern(filename) # Пути и шаблоны раскрываются по дереву
+            if dirs and not recursive:
+                self.display_error(f"rm: cannot remove '{filename}': Is a directory")
+            elif not files and not dirs and 'f' not in flags:
+                self.display_error(f"rm: cannot remove '{filename}': No such file")
+            paths += files
+            if recursive:
+                paths += dirs
+        if not paths:
+            return
+
+        removed_files, removed_dirs = self.store.remove_paths(paths) # Одно изменение дерева для всех путей
+        if self.journal:
+            self.journal.extend(('rm', path) for path in paths)
+        if len(targets) == 1 and paths == [self.normalize_path(targets[0])] and (removed_files, removed_dirs) == (1, 0):
+            self.display_output(f"Removed file: {targets[0]}")
+        else:                                         # Итог пакетного удаления - одной строкой
+            self.display_output(f"Removed {plural(removed_files, 'file', 'files')}, "
+                                f"{plural(removed_dirs, 'directory', 'directories')}")
+
+    def command_chmod(self, args):
+        parsed = self._parse_flags("chmod", args, "Rv")
+        if parsed is None:
+            return
+        flags, args = parsed
+        if len(args) < 2: # Проверяем что минимум два аргумента
+            self.display_error("usage: chmod [-Rv] mode file...")
+            return
+        mode = args[0]                                # Право доступа
+        if not re.match(r'^[0-7]{3}$', mode): # Проверяем, что число состоит из 3 цифр
+            self.display_error(f"chmod: invalid mode: '{mode}'\nTry 'chmod 755 file' or 'chmod 644 file'")
+            return
+        for digit in mode:                           # Дополнительная проверка диапазона чисел
+            if int(digit) > 7:
+                self.display_error(f"chmod: invalid mode: '{mode}'\nEach digit must be between 0 and 7")
+                return
+        changed = {}                                  # Путь -> номер файла
+        records = []                                  # Записи журнала: файлы и директории при -R
+        for filename in args[1:]:
+            files, dirs = self.expand_pattern(filename) # Пути и шаблоны раскрываются по дереву
+            if not files and not dirs:                # Если ничего не нашлось в дереве
+                self.display_error(f"chmod: cannot access '{filename}': No such file or directory")
+                continue
+            if dirs and 'R' not in flags:
+                if dirs == [self.normalize_path(filename)]:  # Ошибка - только для операнда, который сам является директорией
+                    self.display_error(f"chmod: '{filename}': Is a directory")
+                dirs = []                                 # У директорий нет прав: совпавшие с шаблоном пропускаются
+            for path in files:
+                changed[path] = self.store.find_file(path)
+            for path in dirs:                         # -R: все файлы поддерева
+                changed.update(self.store.iter_files(path, self.store.find_dir(path)))
+            records += files + dirs
+        if not changed:
+            return
+
+        self.store.set_modes(changed.values(), int(mode, 8)) # Права хранятся битами режима
+        if self.journal:
+            self.journal.extend(('chmod', mode, path) for path in records)
+        if 'v' in flags:
+            self.display_lines([f"mode of '{path}' changed to {mode}" for path in sorted(changed)])
+        elif not (len(args) == 2 and list(changed) == records == [self.normalize_path(args[1])]): # Итог пакетного изменения - одной строкой
+            self.display_output(f"chmod: mode {mode} set on {plural(len(changed), 'file', 'files')}")
+
+    def command_stats_report(self, args): # stats: число вызовов и p50/p99 по фазам, stats reset - сброс
+        if args and args[0] == "reset":
+            self.command_stats.clear()
+            self.display_output("stats: reset")
+            return
+        if not self.command_stats:
+            self.display_output("stats: no commands recorded")
+            return
+        def percentile(samples, q):
+            ordered = sorted(samples)
+            return ordered[round(q * (len(ordered) - 1))] * 1000
+        lines = [f"{'command':16}{'calls':>8}" + "".join(f"{phase + ' p50/p99 ms':>24}" for phase in PHASES)]
+        for command in sorted(self.command_stats):
+            entry = self.command_stats[command]
+            row = f"{command:16}{entry['count']:8}"
+            for phase in PHASES:
+                row += f"{percentile(entry[phase], 0.5):>13.3f}/{percentile(entry[phase], 0.99):<10.3f}"
+            lines.append(row)
+        self.display_lines(lines)
+
+    def profile_call(self, fn, *args): # Выполнение под cProfile (если включён -profile)
+        if self.profiler is None:
+            return fn(*args)
+        self.profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profiler.disable()
+
+    def end_session(self): # Завершение сессии: профиль и журнал изменений
+        self.write_profile()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def write_profile(self): # Сохранение профиля в конце сессии
+        if not self.profile_path:
+            return
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_path)
+        else:
+            with open(self.profile_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': self.trace_events}, f)
+
+    def command_meminfo(self, args): # Память, занимаемая структурами VFS
+        usage = self.store.meminfo()
+        lines = [f"{size:12}  {name}" for name, size in usage]
+        lines.append(f"{sum(size for _, size in usage):12}  total ({self.store.file_count} files, {self.store.dir_count} dirs)")
+        self.display_lines(lines)
+
+
+class BatchShell(ShellCore):  # Пакетный режим: вывод идёт напрямую в поток, Tk не используется
+    def __init__(self, options, stream):
+        self.stream = stream
+        super().__init__(options)
+
+    def write_output(self, text):
+        self.stream.write(text + "\n")
+
+
+def run_batch(options): # Выполнение скрипта без графического интерфейса, возвращает код завершения
+    stream = open(options['output'], 'w') if options['output'] else sys.stdout
+    try:
+        shell = BatchShell(options, stream)
+        shell.profile_call(shell.start_session)
+        if options['script']:
+            shell.profile_call(shell.run_script, options['script'])
+        else:                                              # Без -script команды читаются из stdin
+            shell.profile_call(shell.run_lines, sys.stdin)
+        shell.end_session()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        else:
+            stream.flush()
+    return 1 if shell.error_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_batch(parse_args(sys.argv[1:])))
@@ -0,0 +1,69 @@
+import mmap
+import os
+import pickle
+import struct
+
+MAGIC = b'VFSSNAP3'                     # Сигнатура и версия формата снимка
+HEADER = struct.Struct('<8sqq')         # Сигнатура, mtime архива (нс), размер архива
+
+
+def archive_key(zip_path): # Ключ снимка: время изменения и размер архива
+    stat = os.stat(zip_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_snapshot(snapshot_path, zip_path): # Загрузка снимка, если он соответствует текущему архиву
+    try:
+        key = archive_key(zip_path)
+        with open(snapshot_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm: # Снимок читается через отображение в память
+                if len(mm) < HEADER.size:
+                    return None
+                magic, mtime_ns, size = HEADER.unpack_from(mm)
+                if magic != MAGIC or (mtime_ns, size) != key: # Архив изменился - снимок устарел
+                    return None
+                with memoryview(mm) as view:
+                    return pickle.loads(view[HEADER.size:])
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError,
+            AttributeError, KeyError, ImportError, TypeError, IndexError): # Снимок другого формата считается устаревшим
+        return None
+
+
+def write_snapshot(snapshot_path, zip_path, payload): # Сохранение построенного индекса VFS
+    mtime_ns, size = archive_key(zip_path)
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as f:                     # Запись во временный файл и атомарная замена
+        f.write(HEADER.pack(MAGIC, mtime_ns, size))
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, snapshot_path)
+
+
+def journal_path(snapshot_path): # Журнал изменений хранится рядом со снимком
+    return snapshot_path + '.journal'
+
+
+def read_journal(snapshot_path): # Чтение записей журнала: списки полей операции
+    try:
+        with open(journal_path(snapshot_path), 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n').split('\t') for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def reset_journal(snapshot_path): # Удаление журнала при пересборке снимка
+    try:
+        os.remove(journal_path(snapshot_path))
+    except FileNotFoundError:
+        pass
+
+
+class Journal:  # Журнал изменений (rm, chmod), дописываемый после каждой операции
+    def __init__(self, snapshot_path):
+        self.file = open(journal_path(snapshot_path), 'a', encoding='utf-8')
+
+    def extend(self, records): # Запись пакета операций с одним сбросом на диск
+        self.file.writelines('\t'.join(fields) + '\n' for fields in records)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
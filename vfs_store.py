@@ -0,0 +1,335 @@
+import sys
+import zipfile
+from array import array
+from collections.abc import Mapping, Set
+
+DIR_BLOCK = 4096     # Размер, который du учитывает для каждой директории
+DEFAULT_MODE = 0o644 # Права доступа файлов после загрузки архива
+
+
+class DirNode:  # Узел дерева директорий VFS
+    __slots__ = ('name', 'dirs', 'files', 'size')
+
+    def __init__(self, name):
+        self.name = name        # Имя директории (для корня - пустая строка)
+        self.dirs = {}          # Поддиректории: имя -> DirNode
+        self.files = {}         # Файлы в директории: имя -> номер файла в колонках VFSStore
+        self.size = 0           # Суммарный размер поддерева (файлы и вложенные директории)
+
+
+class ZipSource:  # Архив, из которого по требованию читается содержимое файлов VFS
+    def __init__(self, zip_path, prefix, zip_ref=None, mountpoint="/"):
+        self.zip_path = zip_path    # Путь к архиву
+        self.prefix = prefix        # Общий префикс, удалённый из путей архива
+        self.zip_ref = zip_ref      # Открытый архив (открывается при первом чтении)
+        self.mount = mountpoint.rstrip('/') # Точка монтирования архива в VFS (для корня - пустая строка)
+
+    def read(self, path): # Чтение файла VFS по его пути
+        if self.zip_ref is None:
+            self.zip_ref = zipfile.ZipFile(self.zip_path, 'r')
+        return self.zip_ref.read(self.prefix + path[len(self.mount) + 1:])
+
+    def __getstate__(self): # В снимок попадает путь, префикс и точка монтирования, но не открытый архив
+        return {'zip_path': self.zip_path, 'prefix': self.prefix, 'mount': self.mount}
+
+    def __setstate__(self, state):
+        self.zip_path = state['zip_path']
+        self.prefix = state['prefix']
+        self.mount = state['mount']
+        self.zip_ref = None
+
+
+class VFSStore:  # Компактное хранилище VFS: дерево имён и колонки атрибутов файлов
+    def __init__(self):
+        self.root = DirNode("")     # Дерево директорий (имена хранятся один раз, пути не хранятся)
+        self.sizes = array('q')     # Размер файла по его номеру
+        self.modes = array('H')     # Права доступа файла в виде битов режима
+        self.source_ids = array('H') # Номер архива-источника файла
+        self.sources = []           # Архивы-источники содержимого
+        self.file_count = 0         # Число существующих файлов
+        self.dir_count = 1          # Число директорий (включая корень)
+
+    def __getstate__(self): # Дерево сохраняется плоским списком: глубина дерева не ограничена глубиной рекурсии pickle
+        state = dict(self.__dict__)
+        nodes = []                                    # (номер родителя, имя, файлы, размер) в порядке обхода в ширину
+        order = [(-1, self.root)]
+        for index, (parent, node) in enumerate(order):
+            nodes.append((parent, node.name, node.files, node.size))
+            order.extend((index, child) for child in node.dirs.values())
+        state['root'] = nodes
+        return state
+
+    def __setstate__(self, state):
+        nodes = state.pop('root')
+        self.__dict__.update(state)
+        built = []
+        for parent, name, files, size in nodes:       # Родитель всегда восстановлен раньше детей
+            node = DirNode(name)
+            node.files = files
+            node.size = size
+            if parent >= 0:
+                built[parent].dirs[name] = node
+            built.append(node)
+        self.root = built[0]
+
+    def add_source(self, source): # Регистрация архива, возвращает его номер
+        self.sources.append(source)
+        return len(self.sources) - 1
+
+    def add_dir(self, path): # Добавление директории (и всех её родителей) в дерево
+        node = self.root
+        for part in path.split('/'):
+            if not part:
+                continue
+            child = node.dirs.get(part)
+            if child is None:                         # Директории ещё нет в дереве - создаём узел
+                part = sys.intern(part)               # Одинаковые имена хранятся в одном экземпляре
+                child = DirNode(part)
+                node.dirs[part] = child
+                self.dir_count += 1
+            node = child
+        return node
+
+    def add_file(self, path, size, source_id): # Добавление файла в дерево и колонки
+        dir_path, name = path.rsplit('/', 1)          # Разделяем путь на директорию и имя файла
+        node = self.add_dir(dir_path)
+        name = sys.intern(name)
+        if name not in node.files:
+            self.file_count += 1
+        node.files[name] = len(self.sizes)
+        self.sizes.append(size)
+        self.modes.append(DEFAULT_MODE)
+        self.source_ids.append(source_id)
+
+    def find_dir(self, normalized_path): # Поиск узла директории по нормализованному пути
+        node = self.root
+        for part in normalized_path.split('/'):
+            if not part:
+                continue
+            node = node.dirs.get(part)
+            if node is None:                          # Такой директории нет
+                return None
+        return node
+
+    def find_file(self, full_path): # Номер файла по пути или None
+        dir_path, name = full_path.rsplit('/', 1)
+        node = self.find_dir(dir_path or "/")         # Директория, в которой лежит файл
+        if node is None:
+            return None
+        return node.files.get(name)
+
+    def _dir_chain(self, dir_path): # Узлы на пути от корня до изменяемой директории или None
+        node = self.root
+        chain = [node]
+        for part in dir_path.split('/'):
+            if not part:
+                continue
+            node = node.dirs.get(part)
+            if node is None:
+                return None
+            chain.append(node)
+        return chain
+
+    def remove_paths(self, paths): # Пакетное удаление файлов и директорий (с содержимым), возвращает (файлов, директорий)
+        by_dir = {}                                   # Удаляемые имена, сгруппированные по родительской директории
+        for path in paths:
+            dir_path, name = path.rsplit('/', 1)
+            by_dir.setdefault(dir_path or "/", []).append(name)
+        files = dirs = 0
+        for dir_path in sorted(by_dir):               # Родитель обрабатывается раньше вложенных путей
+            chain = self._dir_chain(dir_path)
+            if chain is None:                         # Директория уже удалена вместе с родителем
+                continue
+            node = chain[-1]
+            delta = 0
+            for name in by_dir[dir_path]:
+                if name in node.files:
+                    delta += self.sizes[node.files.pop(name)]
+                    files += 1
+                elif name in node.dirs:
+                    child = node.dirs.pop(name)
+                    delta += child.size + DIR_BLOCK
+                    for _, sub in self.iter_dirs(node=child):
+                        dirs += 1
+                        files += len(sub.files)
+            for parent in chain:                      # Один проход до корня на директорию, а не на файл
+                parent.size -= delta
+        self.file_count -= files
+        self.dir_count -= dirs
+        return files, dirs
+
+    def set_mode(self, full_path, mode): # Установка прав доступа (mode - число, например 0o755)
+        file_id = self.find_file(full_path)
+        if file_id is None:
+            return False
+        self.set_modes([file_id], mode)
+        return True
+
+    def set_modes(self, file_ids, mode): # Пакетная установка прав доступа по номерам файлов
+        modes = self.modes
+        for file_id in file_ids:
+            modes[file_id] = mode
+
+    def mode_str(self, file_id): # Права доступа в виде строки '644'
+        return format(self.modes[file_id], '03o')
+
+    def read(self, full_path): # Чтение содержимого файла из его архива
+        file_id = self.find_file(full_path)
+        if file_id is None:
+            raise KeyError(full_path)
+        return self.sources[self.source_ids[file_id]].read(full_path)
+
+    def compute_sizes(self): # Подсчёт размеров всех поддеревьев снизу вверх
+        sizes = self.sizes
+        order = [self.root]
+        for node in order:                            # Обход в ширину: родители раньше детей
+            order.extend(node.dirs.values())
+        for node in reversed(order):                  # Дети обрабатываются раньше родителей
+            node.size = (sum(sizes[file_id] for file_id in node.files.values())
+                         + sum(child.size + DIR_BLOCK for child in node.dirs.values()))
+
+    def iter_dirs(self, path="/", node=None): # Обход директорий поддерева (по умолчанию всего дерева): (путь, узел)
+        stack = [(path, self.root if node is None else node)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            prefix = "/" if path == "/" else path + "/"
+            stack.extend((prefix + name, child) for name, child in node.dirs.items())
+
+    def iter_files(self, path="/", node=None): # Обход файлов поддерева: (путь, номер файла)
+        for path, node in self.iter_dirs(path, node):
+            prefix = "/" if path == "/" else path + "/"
+            for name, file_id in node.files.items():
+                yield prefix + name, file_id
+
+    def meminfo(self): # Оценка занимаемой памяти по структурам, в байтах
+        nodes = 0
+        names = {}
+        file_ids = 0
+        for _, node in self.iter_dirs():
+            nodes += sys.getsizeof(node) + sys.getsizeof(node.dirs) + sys.getsizeof(node.files)
+            names[id(node.name)] = node.name
+            for name, file_id in node.files.items():
+                names[id(name)] = name
+                if file_id > 256:                     # Малые числа кэшируются интерпретатором
+                    file_ids += sys.getsizeof(file_id)
+        return [
+            ('tree nodes', nodes),
+            ('names', sum(sys.getsizeof(name) for name in names.values())),
+            ('file ids', file_ids),
+            ('sizes column', sys.getsizeof(self.sizes)),
+            ('modes column', sys.getsizeof(self.modes)),
+            ('sources column', sys.getsizeof(self.source_ids)),
+        ]
+
+
+class FilesView(Mapping):  # Файлы VFS как словарь путь -> содержимое (читается по требованию)
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, path): # Текст - str, бинарные данные - bytes
+        content = self.store.read(path)
+        try:
+            return content.decode('utf-8')
+        except UnicodeDecodeError:                    # Бинарный файл остаётся байтами
+            return content
+
+    def __contains__(self, path):
+        return isinstance(path, str) and self.store.find_file(path) is not None
+
+    def __iter__(self):
+        return (path for path, _ in self.store.iter_files())
+
+    def __len__(self):
+        return self.store.file_count
+
+
+class PermissionsView(Mapping):  # Права доступа как словарь путь -> '644'
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, path):
+        file_id = self.store.find_file(path)
+        if file_id is None:
+            raise KeyError(path)
+        return self.store.mode_str(file_id)
+
+    def __contains__(self, path):
+        return isinstance(path, str) and self.store.find_file(path) is not None
+
+    def __iter__(self):
+        return (path for path, _ in self.store.iter_files())
+
+    def __len__(self):
+        return self.store.file_count
+
+
+class DirsView(Set):  # Директории VFS как множество путей
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, path):
+        return isinstance(path, str) and self.store.find_dir(path) is not None
+
+    def __iter__(self):
+        return (path for path, _ in self.store.iter_dirs())
+
+    def __len__(self):
+        return self.store.dir_count
+
+
+class OverlayStore(VFSStore):  # Копия VFS для сессии: общее базовое дерево, изменяются только копии узлов
+    def __init__(self, base):
+        self.base = base
+        self.root = base.root
+        self.sizes = base.sizes             # Колонки базового хранилища только читаются
+        self.modes = base.modes
+        self.source_ids = base.source_ids
+        self.sources = base.sources
+        self.file_count = base.file_count
+        self.dir_count = base.dir_count
+        self.mode_overrides = {}            # Номер файла -> права доступа, изменённые в сессии
+        self.owned = set()                  # id узлов, скопированных этой сессией
+
+    def _own_path(self, parts): # Копирование узлов на пути от корня (copy-on-write), возвращает их список
+        if id(self.root) not in self.owned:
+            self.root = self._copy_node(self.root)
+        node = self.root
+        nodes = [node]
+        for part in parts:
+            child = node.dirs[part]
+            if id(child) not in self.owned:
+                child = self._copy_node(child)
+                node.dirs[part] = child
+            node = child
+            nodes.append(node)
+        return nodes
+
+    def _copy_node(self, node):
+        copy = DirNode(node.name)
+        copy.dirs = dict(node.dirs)         # Поддиректории остаются общими до их изменения
+        copy.files = dict(node.files)
+        copy.size = node.size
+        self.owned.add(id(copy))
+        return copy
+
+    def _dir_chain(self, dir_path): # Изменяются только копии узлов сессии
+        if self.find_dir(dir_path) is None:
+            return None
+        return self._own_path([part for part in dir_path.split('/') if part])
+
+    def set_modes(self, file_ids, mode):
+        self.mode_overrides.update(dict.fromkeys(file_ids, mode))
+
+    def mode_str(self, file_id):
+        return format(self.mode_overrides.get(file_id, self.modes[file_id]), '03o')
+
+    def meminfo(self):
+        usage = super().meminfo()
+        owned = 0
+        for _, node in self.iter_dirs():
+            if id(node) in self.owned:
+                owned += sys.getsizeof(node) + sys.getsizeof(node.dirs) + sys.getsizeof(node.files)
+        usage.append(('overlay nodes', owned))
+        usage.append(('mode overrides', sys.getsizeof(self.mode_overrides)))
+        return usage